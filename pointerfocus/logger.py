@@ -47,6 +47,8 @@ class Logger(object):
         LOGGER.log('Log this message')
         LOGGER.log('Log this message', level='error')
         LOGGER.log(var='var_name')
+        if LOGGER.is_enabled('debug'):
+            LOGGER.log('Log this %r' % costly_object, level='debug')
     
     """
     
@@ -75,10 +77,17 @@ class Logger(object):
                       'error': self.logger.error,
                       'critical': self.logger.critical}[level]
             logger(message)
-        elif var:
-            self.logger.debug('%s: %r' % (var, sys._getframe(1).f_locals[var]))
-        else:
-            self.logger.debug(whoami())
+        elif self.logger.isEnabledFor(logging.DEBUG):
+            # Only inspect the stack for a message that will be logged.
+            if var:
+                self.logger.debug('%s: %r' %
+                                  (var, sys._getframe(1).f_locals[var]))
+            else:
+                self.logger.debug(whoami())
+    
+    def is_enabled(self, level='info'):
+        """Return True if a message at this level would be logged."""
+        return self.logger.isEnabledFor(getattr(logging, level.upper()))
 
 def whoami():
     """Identify the calling function for logging."""
@@ -100,6 +109,7 @@ def test():
         LOGGER.log('Log this message')
         LOGGER.log(var='test_var')
         LOGGER.log()
+        print('DEBUG enabled: %s' % LOGGER.is_enabled('debug'))
         for level in ('debug', 'info', 'warning', 'error', 'critical'):
             LOGGER.log('Log this %s message' % level, level=level)
 
@@ -28,10 +28,18 @@ PointerFocusWindowHelper    -- object is constructed for each Gedit window
 """
 
 import gedit
+import gobject
 import gtk
 
 from .logger import Logger
 LOGGER = Logger(level=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')[2])
+# Checked once here so costly log messages are only built when they are logged.
+VERBOSE = LOGGER.is_enabled('info')
+
+# How PointerFocusWindowHelper._walk treats each widget class, filled in as
+# classes are first seen so each widget needs only a dict lookup.
+NOTEBOOK, CONTAINER, OTHER = range(3)
+WIDGET_KINDS = {}
 
 class PointerFocusPlugin(gedit.Plugin):
     
@@ -85,6 +93,18 @@ class PointerFocusWindowHelper(object):
     
     """
     
+    __slots__ = (
+        '_window',
+        '_handlers_per_notebook',
+        '_connected_notebook_ids',
+        '_handlers_per_focusable',
+        '_connected_ids',
+        '_walked_pages',
+        '_pending_focus',
+        '_idle_id',
+        '_enter_notify_callback',
+        )
+    
     def __init__(self, window):
         """Initialize attributes for this window."""
         LOGGER.log()
@@ -92,27 +112,44 @@ class PointerFocusWindowHelper(object):
         self._window = window
         """The window this PointerFocusWindowHelper runs on."""
         
-        self._handlers_per_notebook = {}
-        """A signal handler for each gtk.Notebook."""
+        self._handlers_per_notebook = []
+        """(gtk.Notebook, signal handler) pairs for the page signals."""
+        
+        self._connected_notebook_ids = set()
+        """The id of each gtk.Notebook that has a signal handler."""
     
-        self._handlers_per_focusable = {}
-        """A signal handler for each focusable widget."""
+        self._handlers_per_focusable = []
+        """A (widget, signal handler) pair for each focusable widget."""
+        
+        self._connected_ids = set()
+        """The id of each focusable widget that has a signal handler."""
+        
+        self._walked_pages = set()
+        """The notebook pages whose widgets have already been connected."""
+        
+        self._pending_focus = None
+        """The widget most recently entered by the pointer."""
+        
+        self._idle_id = 0
+        """The idle source that will give focus to the pending widget."""
+        
+        self._enter_notify_callback = self._on_enter_notify_event
+        """One bound method shared by every focusable widget's handler."""
     
     def activate(self):
         """Start this instance of Pointer Focus."""
         LOGGER.log()
         LOGGER.log('Pointer Focus activating for %s' % self._window)
         
-        notebooks = self._get_notebooks(self._window)
-        LOGGER.log('notebooks:\n %s' %
-                   '\n '.join([repr(x) for x in notebooks]))
+        notebooks, focusables = self._walk(self._window)
+        if VERBOSE:
+            LOGGER.log('notebooks:\n %s' %
+                       '\n '.join(repr(x) for x in notebooks))
         self._connect_notebooks(notebooks)
         
-        focusables = set()
-        for notebook in notebooks:
-            focusables |= self._get_focusables(notebook)
-        LOGGER.log('focusables:\n %s' %
-                   '\n '.join([repr(x) for x in focusables]))
+        if VERBOSE:
+            LOGGER.log('focusables:\n %s' %
+                       '\n '.join(repr(x) for x in focusables))
         self._connect_focusables(focusables)
     
     def deactivate(self):
@@ -120,94 +157,206 @@ class PointerFocusWindowHelper(object):
         LOGGER.log()
         self._disconnect_notebooks()
         self._disconnect_focusables()
+        self._walked_pages = set()
+        if self._idle_id:
+            gobject.source_remove(self._idle_id)
+            self._idle_id = 0
+        self._pending_focus = None
         LOGGER.log('Pointer Focus deactivated for %s' % self._window)
     
     # Collect widgets
     
-    def _get_notebooks(self, widget, original=True):
-        """Return a set of gtk.Notebook widgets."""
-        if original:
-            LOGGER.log()
-        notebooks = set()
+    def _walk(self, root, visible=False):
+        """
+        Return a list of gtk.Notebook widgets and a list of widgets that can
+        grab focus, found in a single pass over the widget tree under root.
         
-        try:
-            children = widget.get_children()
-        except AttributeError:
-            pass
-        else:
-            if isinstance(widget, gtk.Notebook):
-                notebooks.add(widget)
-            for child in children:
-                notebooks |= self._get_notebooks(child, False)
-        return notebooks
-    
-    def _get_focusables(self, widget, original=True):
-        """Return a set of widgets that can grab focus."""
-        if original:
-            LOGGER.log()
-        focusables = set()
-        
-        can_focus = widget.get_property('can_focus')
-        if can_focus:
-            focusables.add(widget)
-        try:
-            children = widget.get_children()
-        except AttributeError:
-            pass
+        Only the current page of each notebook is visited; other pages,
+        and any notebooks on them, are handled when they are switched to.
+        root is treated as being on a current page if visible is True.
+        
+        Pages visited are recorded in _walked_pages and are not visited
+        again, so the caller must connect the widgets returned.
+        """
+        LOGGER.log()
+        notebooks = []
+        focusables = []
+        # Local names avoid module attribute lookups for every widget.
+        kinds = WIDGET_KINDS
+        walked_pages = self._walked_pages
+        notebook_type = gtk.Notebook
+        container_type = gtk.Container
+        
+        # Widgets still to visit: outside of any notebook,
+        # or on a current notebook page.
+        # Containers push their children directly with foreach, which
+        # avoids building a list of children for each one.
+        outside = []
+        shown = []
+        if visible:
+            shown.append(root)
         else:
-            for child in children:
-                focusables |= self._get_focusables(child, False)
-        return focusables
+            outside.append(root)
+        while outside or shown:
+            work = outside or shown
+            widget = work.pop()
+            widget_type = type(widget)
+            kind = kinds.get(widget_type)
+            if kind is None:
+                if issubclass(widget_type, notebook_type):
+                    kind = NOTEBOOK
+                elif issubclass(widget_type, container_type):
+                    kind = CONTAINER
+                else:
+                    kind = OTHER
+                kinds[widget_type] = kind
+            
+            if work is outside:
+                if kind == NOTEBOOK:
+                    shown.append(widget)
+                elif kind == CONTAINER:
+                    widget.foreach(outside.append)
+            else:
+                if widget.get_can_focus():
+                    focusables.append(widget)
+                if kind == NOTEBOOK:
+                    notebooks.append(widget)
+                    current = widget.get_nth_page(widget.get_current_page())
+                    if current is not None and current not in walked_pages:
+                        walked_pages.add(current)
+                        shown.append(current)
+                elif kind == CONTAINER:
+                    widget.foreach(shown.append)
+        return notebooks, focusables
     
-    # Respond to a notebook page added
+    # Respond to a notebook page added or switched to
     # (e.g. if a document is opened or a paned plugin is activated).
     
     def _connect_notebooks(self, notebooks):
-        """Connect to the 'add' signal of each gtk.Notebook widget."""
+        """Connect to the page signals of each gtk.Notebook widget."""
         LOGGER.log()
         for notebook in notebooks:
-            self._handlers_per_notebook[notebook] = notebook.connect(
-                'page-added', self._on_page_added)
-            LOGGER.log('Connected to %r' % notebook)
+            notebook_id = id(notebook)
+            if notebook_id in self._connected_notebook_ids:
+                continue
+            self._connected_notebook_ids.add(notebook_id)
+            self._handlers_per_notebook.append((notebook, notebook.connect(
+                'page-added', self._on_page_added)))
+            self._handlers_per_notebook.append((notebook, notebook.connect(
+                'switch-page', self._on_switch_page)))
+            self._handlers_per_notebook.append((notebook, notebook.connect(
+                'page-removed', self._on_page_removed)))
+            if VERBOSE:
+                LOGGER.log('Connected to %r' % notebook)
     
     def _disconnect_notebooks(self):
         """Disconnect signal handlers from gtk.Notebook widgets."""
         LOGGER.log()
-        for notebook in self._handlers_per_notebook:
-            notebook.disconnect(self._handlers_per_notebook[notebook])
-            LOGGER.log('Disconnected from %r' % notebook)
-        self._handlers_per_notebook = {}
+        for notebook, handler_id in self._handlers_per_notebook:
+            # Handlers of a destroyed notebook are already gone.
+            if notebook.handler_is_connected(handler_id):
+                notebook.disconnect(handler_id)
+            if VERBOSE:
+                LOGGER.log('Disconnected from %r' % notebook)
+        self._handlers_per_notebook = []
+        self._connected_notebook_ids = set()
     
     def _on_page_added(self, notebook, child, page_num):
-        """Connect signal handlers to widgets within the new page."""
+        """Connect signal handlers within the new page if it is current."""
+        LOGGER.log()
+        if VERBOSE:
+            LOGGER.log('%r has new page [%d] %r' %
+                       (notebook, page_num, child))
+        if page_num == notebook.get_current_page():
+            self._connect_page(child)
+    
+    def _on_switch_page(self, notebook, page, page_num):
+        """Connect signal handlers to widgets within the current page."""
         LOGGER.log()
-        LOGGER.log('%r has new page [%d] %r' % (notebook, page_num, child))
-        focusables = self._get_focusables(child)
+        child = notebook.get_nth_page(page_num)
+        if VERBOSE:
+            LOGGER.log('%r switched to page [%d] %r' %
+                       (notebook, page_num, child))
+        self._connect_page(child)
+    
+    def _on_page_removed(self, notebook, child, page_num):
+        """Forget that the removed page was walked."""
+        LOGGER.log()
+        self._walked_pages.discard(child)
+    
+    def _connect_page(self, child):
+        """
+        Connect signal handlers to widgets within a notebook page.
+        
+        A page is only walked the first time it is shown, so switching back
+        to it costs nothing.  Widgets added later inside a page that was
+        already walked are not connected; only new pages are walked.
+        """
+        LOGGER.log()
+        if child in self._walked_pages:
+            return
+        self._walked_pages.add(child)
+        notebooks, focusables = self._walk(child, True)
+        self._connect_notebooks(notebooks)
         self._connect_focusables(focusables)
     
     # Respond to the pointer entering a focusable widget.
+    # GTK does not propagate crossing events to parent widgets, so each
+    # focusable widget gets its own handler rather than one on the window.
     
     def _connect_focusables(self, focusables):
         """Connect to the 'enter-notify-event' signal of each widget."""
         LOGGER.log()
+        enter_notify_mask = gtk.gdk.ENTER_NOTIFY_MASK
         for focusable in focusables:
-            focusable.add_events(gtk.gdk.ENTER_NOTIFY_MASK)
-            self._handlers_per_focusable[focusable] = focusable.connect(
-                'enter-notify-event', self._on_enter_notify_event)
-            LOGGER.log('Connected to %r' % focusable)
+            focusable_id = id(focusable)
+            if focusable_id in self._connected_ids:
+                continue
+            self._connected_ids.add(focusable_id)
+            # get_events() only reports masks added with set_events or
+            # add_events, not those a widget gives its GdkWindow when it is
+            # realized, so this only skips a widget given the mask before.
+            if not focusable.get_events() & enter_notify_mask:
+                focusable.add_events(enter_notify_mask)
+            self._handlers_per_focusable.append((focusable, focusable.connect(
+                'enter-notify-event', self._enter_notify_callback)))
+            if VERBOSE:
+                LOGGER.log('Connected to %r' % focusable)
     
     def _disconnect_focusables(self):
         """Disconnect signal handlers from focusable widgets."""
         LOGGER.log()
-        for focusable in self._handlers_per_focusable:
-            focusable.disconnect(self._handlers_per_focusable[focusable])
-            LOGGER.log('Disconnected from %r' % focusable)
-        self._handlers_per_focusable = {}
+        for focusable, handler_id in self._handlers_per_focusable:
+            # Handlers of a destroyed widget are already gone.
+            if focusable.handler_is_connected(handler_id):
+                focusable.disconnect(handler_id)
+            if VERBOSE:
+                LOGGER.log('Disconnected from %r' % focusable)
+        self._handlers_per_focusable = []
+        self._connected_ids = set()
     
     def _on_enter_notify_event(self, widget, event):
-        """Have the widget grab the keyboard focus."""
-        LOGGER.log()
-        LOGGER.log('The pointer entered %r at (%d, %d)' %
-                   (widget, event.x, event.y))
-        widget.grab_focus()
+        """Schedule the widget to grab the keyboard focus."""
+        # Crossings between a widget's own windows need not repeat the grab.
+        if event.detail in (gtk.gdk.NOTIFY_INFERIOR, gtk.gdk.NOTIFY_VIRTUAL):
+            return False
+        # Nothing to do if the widget has the focus and no other is pending.
+        if not self._idle_id and widget.is_focus():
+            return False
+        if VERBOSE:
+            LOGGER.log()
+            LOGGER.log('The pointer entered %r at (%d, %d)' %
+                       (widget, event.x, event.y))
+        self._pending_focus = widget
+        if not self._idle_id:
+            self._idle_id = gobject.idle_add(self._apply_focus)
+        return False
+    
+    def _apply_focus(self):
+        """Have the last widget entered grab the keyboard focus."""
+        if not self._pending_focus.is_focus():
+            self._pending_focus.grab_focus()
+        self._pending_focus = None
+        self._idle_id = 0
+        return False
 